@@ -5,20 +5,315 @@ ESP-NOW Data Analysis for Web of Grace Project
 Analyzes collected ESP-NOW metrics and generates visualizations.
 
 Usage:
+    python analyze.py data/raw/esp_now_data_20231215_143022.parquet
     python analyze.py data/raw/esp_now_data_20231215_143022.csv
-    python analyze.py --input data/processed/ --output reports/
+    python analyze.py data/processed/ --output reports/   # every file in a directory
 """
 
+from __future__ import annotations
+
 import argparse
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 import numpy as np
 
+try:
+    import polars as pl
+except ImportError:  # fall back to pandas (pyarrow-backed where available)
+    pl = None
+    import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = None
+
+
+# Columns the analysis actually touches; scans only read these
+ANALYSIS_COLUMNS = ['seq', 'rssi', 'lat_us', 'timestamp_ns', 'timestamp']
+
+# Resolve the matplotlib style once at import rather than on every report
+PLOT_STYLE = 'seaborn-v0_8' if 'seaborn-v0_8' in plt.style.available else 'default'
+plt.style.use(PLOT_STYLE)
+
+# Line plots beyond this many points only cost render time at report resolution
+MAX_PLOT_POINTS = 5000
+
+
+def _hist_bins(values: np.ndarray, bins: int = 30) -> np.ndarray:
+    """Explicit, evenly spaced histogram bin edges spanning the data."""
+    if values.size == 0:
+        return np.linspace(0, 1, bins + 1)
+    return np.linspace(values.min(), values.max(), bins + 1)
+
+
+def find_data_files(directory: str) -> List[Path]:
+    """List the Parquet and CSV data files in a directory, sorted by name."""
+    data_dir = Path(directory)
+    return sorted(list(data_dir.glob("*.parquet")) + list(data_dir.glob("*.csv")))
+
+
+def scan_data(path: str) -> pl.LazyFrame:
+    """Build a lazy scan over a Parquet file, a legacy CSV file, or a directory of them."""
+    if Path(path).is_dir():
+        files = find_data_files(path)
+        if not files:
+            raise FileNotFoundError(f"No Parquet or CSV files found in {path}")
+        # Polars executes the per-file scans of a concat in parallel
+        return pl.concat([scan_data(str(f)) for f in files], how='diagonal_relaxed')
+    
+    if Path(path).suffix.lower() == '.parquet':
+        lf = pl.scan_parquet(path)
+    else:
+        lf = pl.scan_csv(path, try_parse_dates=True)
+    
+    columns = lf.collect_schema().names()
+    lf = lf.select([c for c in ANALYSIS_COLUMNS if c in columns])
+    
+    if Path(path).suffix.lower() != '.parquet':
+        # CSV carries no types: all-empty columns come back as str and legacy
+        # pandas output wrote floats ("1.0"), so go through Float64
+        lf = lf.with_columns([
+            pl.col(c).cast(pl.Float64).cast(dtype)
+            for c, dtype in (('seq', pl.UInt32), ('rssi', pl.Int16), ('lat_us', pl.UInt32))
+            if c in columns
+        ])
+    
+    # Epoch nanoseconds become a datetime column for plotting
+    if 'timestamp_ns' in columns:
+        lf = lf.with_columns(
+            pl.from_epoch('timestamp_ns', time_unit='ns').alias('timestamp')
+        )
+    
+    return lf
+
+
+def compute_stats(lf: pl.LazyFrame) -> dict:
+    """Compute summary statistics with a single fused lazy query."""
+    columns = lf.collect_schema().names()
+    
+    stats = {
+        'total_samples': 0,
+        'time_span': None,
+        'rssi_stats': {},
+        'latency_stats': {},
+        'packet_loss': 0
+    }
+    
+    # Every aggregate goes into one plan, so each column is scanned once
+    aggregations = [pl.len().alias('total_samples')]
+    # Prefer raw epoch nanoseconds; legacy files only have parsed timestamps
+    ts_col = 'timestamp_ns' if 'timestamp_ns' in columns else 'timestamp'
+    if ts_col in columns:
+        aggregations += [
+            pl.col(ts_col).min().alias('ts_min'),
+            pl.col(ts_col).max().alias('ts_max'),
+        ]
+    if 'rssi' in columns:
+        rssi = pl.col('rssi').drop_nulls()
+        aggregations += [
+            rssi.mean().alias('rssi_mean'),
+            rssi.std().alias('rssi_std'),
+            rssi.min().alias('rssi_min'),
+            rssi.max().alias('rssi_max'),
+            rssi.median().alias('rssi_median'),
+        ]
+    if 'lat_us' in columns:
+        lat = pl.col('lat_us').drop_nulls()
+        aggregations += [
+            lat.mean().alias('lat_mean'),
+            lat.std().alias('lat_std'),
+            lat.min().alias('lat_min'),
+            lat.max().alias('lat_max'),
+            lat.median().alias('lat_median'),
+            lat.quantile(0.95, 'nearest').alias('lat_p95'),
+            lat.quantile(0.99, 'nearest').alias('lat_p99'),
+        ]
+    if 'seq' in columns:
+        # count() skips nulls, so timeout rows don't count as received
+        aggregations += [
+            pl.col('seq').min().alias('seq_min'),
+            pl.col('seq').max().alias('seq_max'),
+            pl.col('seq').count().alias('seq_count'),
+        ]
+    
+    row = lf.select(aggregations).collect().row(0, named=True)
+    stats['total_samples'] = row['total_samples']
+    
+    # Polars yields None where pandas gave NaN (std of one sample, all-null
+    # columns); keep NaN so the summary still formats
+    row.update({k: float('nan') for k, v in row.items()
+                if v is None and k.startswith(('rssi_', 'lat_'))})
+    
+    # Time analysis
+    if ts_col in columns and row['ts_min'] is not None:
+        span = row['ts_max'] - row['ts_min']
+        duration = span / 1e9 if ts_col == 'timestamp_ns' else span.total_seconds()
+        stats['time_span'] = f"{duration:.1f} seconds"
+    
+    # RSSI analysis
+    if 'rssi' in columns:
+        stats['rssi_stats'] = {
+            'mean': row['rssi_mean'],
+            'std': row['rssi_std'],
+            'min': row['rssi_min'],
+            'max': row['rssi_max'],
+            'median': row['rssi_median']
+        }
+    
+    # Latency analysis
+    if 'lat_us' in columns:
+        stats['latency_stats'] = {
+            'mean_us': row['lat_mean'],
+            'std_us': row['lat_std'],
+            'min_us': row['lat_min'],
+            'max_us': row['lat_max'],
+            'median_us': row['lat_median'],
+            'p95_us': row['lat_p95'],
+            'p99_us': row['lat_p99']
+        }
+    
+    # Packet loss (estimate from sequence gaps)
+    if 'seq' in columns and row['seq_count'] > 0:
+        expected_packets = int(row['seq_max'] - row['seq_min'] + 1)
+        actual_packets = row['seq_count']
+        stats['packet_loss'] = max(0, (expected_packets - actual_packets) / expected_packets * 100) if expected_packets > 0 else 0
+    
+    return stats
+
+
+def read_data_pandas(path: str) -> pd.DataFrame:
+    """Read a Parquet file, a legacy CSV file, or a directory of them with pandas."""
+    if Path(path).is_dir():
+        files = find_data_files(path)
+        if not files:
+            raise FileNotFoundError(f"No Parquet or CSV files found in {path}")
+        return pd.concat([read_data_pandas(str(f)) for f in files], ignore_index=True)
+    
+    try:
+        import pyarrow.parquet as pq
+        
+        # Multi-threaded Arrow readers with Arrow-backed columns
+        if Path(path).suffix.lower() == '.parquet':
+            available = pq.read_schema(path).names
+            columns = [c for c in ANALYSIS_COLUMNS if c in available]
+            df = pd.read_parquet(path, columns=columns, dtype_backend='pyarrow')
+        else:
+            df = pd.read_csv(path, engine='pyarrow', dtype_backend='pyarrow')
+    except ImportError:
+        if Path(path).suffix.lower() == '.parquet':
+            raise
+        df = pd.read_csv(path)
+    
+    df = df.drop(columns=[c for c in df.columns if c not in ANALYSIS_COLUMNS])
+    
+    # Epoch nanoseconds become a datetime column for plotting
+    if 'timestamp_ns' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp_ns'], unit='ns')
+    elif 'timestamp' in df.columns:
+        df['timestamp'] = pd.to_datetime(df['timestamp'])
+    
+    return df
+
+
+def _summarize_column(values: pd.Series) -> dict:
+    """Mean, std, extremes and median/p95/p99 of one pandas column."""
+    if pa is None:
+        data = values.dropna()
+        return {
+            'mean': data.mean(), 'std': data.std(),
+            'min': data.min(), 'max': data.max(),
+            'median': data.median(),
+            'p95': data.quantile(0.95), 'p99': data.quantile(0.99)
+        }
+    
+    # Arrow kernels skip nulls; one exact quantile call covers median/p95/p99
+    col = pa.array(values, from_pandas=True)
+    if pa.types.is_null(col.type):
+        col = col.cast(pa.float64())  # all-empty column has no numeric type
+    extremes = pc.min_max(col)
+    median, p95, p99 = pc.quantile(col, q=[0.5, 0.95, 0.99]).to_pylist()
+    summary = {
+        'mean': pc.mean(col).as_py(), 'std': pc.stddev(col, ddof=1).as_py(),
+        'min': extremes['min'].as_py(), 'max': extremes['max'].as_py(),
+        'median': median, 'p95': p95, 'p99': p99
+    }
+    # Kernels return null on empty input (and stddev for n <= 1); match pandas' NaN
+    return {k: float('nan') if v is None else v for k, v in summary.items()}
+
+
+def compute_stats_pandas(df: pd.DataFrame) -> dict:
+    """Compute summary statistics from a pandas DataFrame."""
+    stats = {
+        'total_samples': len(df),
+        'time_span': None,
+        'rssi_stats': {},
+        'latency_stats': {},
+        'packet_loss': 0
+    }
+    
+    # Time analysis
+    if 'timestamp_ns' in df.columns:
+        duration = (df['timestamp_ns'].max() - df['timestamp_ns'].min()) / 1e9
+        stats['time_span'] = f"{duration:.1f} seconds"
+    elif 'timestamp' in df.columns:
+        duration = (df['timestamp'].max() - df['timestamp'].min()).total_seconds()
+        stats['time_span'] = f"{duration:.1f} seconds"
+    
+    # RSSI analysis
+    if 'rssi' in df.columns:
+        rssi = _summarize_column(df['rssi'])
+        stats['rssi_stats'] = {
+            'mean': rssi['mean'],
+            'std': rssi['std'],
+            'min': rssi['min'],
+            'max': rssi['max'],
+            'median': rssi['median']
+        }
+    
+    # Latency analysis
+    if 'lat_us' in df.columns:
+        lat = _summarize_column(df['lat_us'])
+        stats['latency_stats'] = {
+            'mean_us': lat['mean'],
+            'std_us': lat['std'],
+            'min_us': lat['min'],
+            'max_us': lat['max'],
+            'median_us': lat['median'],
+            'p95_us': lat['p95'],
+            'p99_us': lat['p99']
+        }
+    
+    # Packet loss (estimate from sequence gaps)
+    if 'seq' in df.columns:
+        seq_data = df['seq'].dropna()
+        if seq_data.size > 0:
+            expected_packets = int(seq_data.max() - seq_data.min() + 1)
+            actual_packets = seq_data.size
+            stats['packet_loss'] = max(0, (expected_packets - actual_packets) / expected_packets * 100) if expected_packets > 0 else 0
+    
+    return stats
+
+
+def file_stats(path: str) -> dict:
+    """Compute summary statistics for a single data file."""
+    if pl is None:
+        return compute_stats_pandas(read_data_pandas(path))
+    return compute_stats(scan_data(path))
+
+
+def _try_file_stats(path: str):
+    """file_stats() that returns the exception instead of raising it."""
+    try:
+        return file_stats(path)
+    except Exception as e:
+        return e
+
 
 class ESP8266DataAnalyzer:
     """Analyzes ESP-NOW performance metrics."""
@@ -26,78 +321,60 @@ class ESP8266DataAnalyzer:
     def __init__(self, data_file: str):
         """Initialize analyzer with data file."""
         self.data_file = data_file
-        self.df: Optional[pd.DataFrame] = None
+        self.lf: Optional[pl.LazyFrame] = None
+        self.df: Optional[pl.DataFrame | pd.DataFrame] = None
         
     def load_data(self) -> bool:
-        """Load data from CSV file."""
+        """Open a Parquet file (or a legacy CSV file) for lazy analysis."""
         try:
-            self.df = pd.read_csv(self.data_file)
+            if pl is None:
+                self.df = read_data_pandas(self.data_file)
+                print(f"✅ Loaded {len(self.df)} records from {self.data_file}")
+                return True
             
-            # Convert timestamp if present
-            if 'timestamp' in self.df.columns:
-                self.df['timestamp'] = pd.to_datetime(self.df['timestamp'])
+            self.lf = scan_data(self.data_file)
             
-            print(f"✅ Loaded {len(self.df)} records from {self.data_file}")
+            # Row count only; Parquet answers this from file metadata
+            total = self.lf.select(pl.len()).collect().item()
+            print(f"✅ Loaded {total} records from {self.data_file}")
             return True
             
         except Exception as e:
             print(f"❌ Failed to load data: {e}")
             return False
     
+    def materialize(self):
+        """Collect the lazy scan once so summary and plots share the rows."""
+        if self.df is None and self.lf is not None:
+            self.df = self.lf.collect()
+    
     def basic_stats(self) -> dict:
         """Generate basic statistics summary."""
-        if self.df is None:
-            return {}
-        
-        stats = {
-            'total_samples': len(self.df),
-            'time_span': None,
-            'rssi_stats': {},
-            'latency_stats': {},
-            'packet_loss': 0
-        }
-        
-        # Time analysis
-        if 'timestamp' in self.df.columns:
-            duration = (self.df['timestamp'].max() - self.df['timestamp'].min()).total_seconds()
-            stats['time_span'] = f"{duration:.1f} seconds"
-        
-        # RSSI analysis
-        if 'rssi' in self.df.columns:
-            rssi_data = self.df['rssi'].dropna()
-            stats['rssi_stats'] = {
-                'mean': rssi_data.mean(),
-                'std': rssi_data.std(),
-                'min': rssi_data.min(),
-                'max': rssi_data.max(),
-                'median': rssi_data.median()
-            }
-        
-        # Latency analysis
-        if 'lat_us' in self.df.columns:
-            lat_data = self.df['lat_us'].dropna()
-            stats['latency_stats'] = {
-                'mean_us': lat_data.mean(),
-                'std_us': lat_data.std(),
-                'min_us': lat_data.min(),
-                'max_us': lat_data.max(),
-                'median_us': lat_data.median(),
-                'p95_us': lat_data.quantile(0.95),
-                'p99_us': lat_data.quantile(0.99)
-            }
-        
-        # Packet loss (estimate from sequence gaps)
-        if 'seq' in self.df.columns:
-            seq_data = self.df['seq'].dropna().sort_values()
-            expected_packets = seq_data.max() - seq_data.min() + 1 if len(seq_data) > 0 else 0
-            actual_packets = len(seq_data)
-            stats['packet_loss'] = max(0, (expected_packets - actual_packets) / expected_packets * 100) if expected_packets > 0 else 0
+        if self.df is not None:
+            if pl is not None:
+                return compute_stats(self.df.lazy())
+            return compute_stats_pandas(self.df)
+        if self.lf is not None:
+            return compute_stats(self.lf)
+        return {}
+    
+    def _plot_columns(self) -> dict:
+        """Plot columns as NumPy arrays, with missing values as NaN."""
+        names = [c for c in ('timestamp', 'rssi', 'lat_us') if c in self.df.columns]
+        if pl is not None:
+            return {c: self.df[c].to_numpy() if c == 'timestamp'
+                    else self.df[c].cast(pl.Float64).to_numpy() for c in names}
         
-        return stats
+        columns = {c: self.df[c].to_numpy(dtype='float64', na_value=np.nan)
+                   for c in names if c != 'timestamp'}
+        if 'timestamp' in names:
+            columns['timestamp'] = self.df['timestamp'].to_numpy(dtype='datetime64[ns]')
+        return columns
     
-    def print_summary(self):
+    def print_summary(self, stats: Optional[dict] = None):
         """Print analysis summary to console."""
-        stats = self.basic_stats()
+        if stats is None:
+            stats = self.basic_stats()
         
         print("\n📊 ESP-NOW Performance Analysis")
         print("=" * 50)
@@ -126,62 +403,67 @@ class ESP8266DataAnalyzer:
     
     def create_visualizations(self, output_dir: str = "reports/"):
         """Generate analysis plots."""
-        if self.df is None:
+        if self.lf is None and self.df is None:
             print("❌ No data loaded for visualization")
             return
         
+        # Plots need the actual rows
+        self.materialize()
+        columns = self._plot_columns()
+        
         # Ensure output directory exists
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         
-        # Set up matplotlib style
-        plt.style.use('seaborn-v0_8' if 'seaborn-v0_8' in plt.style.available else 'default')
+        fig, ax = plt.subplots(2, 2, figsize=(12, 8))
         
         # 1. RSSI Distribution
-        if 'rssi' in self.df.columns:
-            plt.figure(figsize=(10, 6))
-            plt.subplot(2, 2, 1)
-            self.df['rssi'].hist(bins=30, alpha=0.7, color='blue')
-            plt.xlabel('RSSI (dBm)')
-            plt.ylabel('Frequency')
-            plt.title('RSSI Distribution')
-            plt.grid(True, alpha=0.3)
+        if 'rssi' in columns:
+            rssi = columns['rssi'][~np.isnan(columns['rssi'])]
+            ax[0, 0].hist(rssi, bins=_hist_bins(rssi), alpha=0.7, color='blue')
+            ax[0, 0].set_xlabel('RSSI (dBm)')
+            ax[0, 0].set_ylabel('Frequency')
+            ax[0, 0].set_title('RSSI Distribution')
+            ax[0, 0].grid(True, alpha=0.3)
         
         # 2. Latency Distribution
-        if 'lat_us' in self.df.columns:
-            plt.subplot(2, 2, 2)
-            self.df['lat_us'].hist(bins=30, alpha=0.7, color='green')
-            plt.xlabel('Latency (μs)')
-            plt.ylabel('Frequency')
-            plt.title('Latency Distribution')
-            plt.grid(True, alpha=0.3)
+        if 'lat_us' in columns:
+            lat = columns['lat_us'][~np.isnan(columns['lat_us'])]
+            ax[0, 1].hist(lat, bins=_hist_bins(lat), alpha=0.7, color='green')
+            ax[0, 1].set_xlabel('Latency (μs)')
+            ax[0, 1].set_ylabel('Frequency')
+            ax[0, 1].set_title('Latency Distribution')
+            ax[0, 1].grid(True, alpha=0.3)
         
         # 3. Time series (if timestamp available)
-        if 'timestamp' in self.df.columns and 'rssi' in self.df.columns:
-            plt.subplot(2, 2, 3)
-            plt.plot(self.df['timestamp'], self.df['rssi'], alpha=0.6, linewidth=0.8)
-            plt.xlabel('Time')
-            plt.ylabel('RSSI (dBm)')
-            plt.title('RSSI vs Time')
-            plt.xticks(rotation=45)
-            plt.grid(True, alpha=0.3)
+        if 'timestamp' in columns and 'rssi' in columns:
+            # Downsample long sessions; the PNG can't show more points anyway
+            stride = max(1, len(self.df) // MAX_PLOT_POINTS)
+            ax[1, 0].plot(columns['timestamp'][::stride], columns['rssi'][::stride], alpha=0.6, linewidth=0.8)
+            ax[1, 0].set_xlabel('Time')
+            ax[1, 0].set_ylabel('RSSI (dBm)')
+            ax[1, 0].set_title('RSSI vs Time')
+            ax[1, 0].tick_params(axis='x', labelrotation=45)
+            ax[1, 0].grid(True, alpha=0.3)
         
         # 4. RSSI vs Latency correlation
-        if 'rssi' in self.df.columns and 'lat_us' in self.df.columns:
-            plt.subplot(2, 2, 4)
-            plt.scatter(self.df['rssi'], self.df['lat_us'], alpha=0.6, s=10)
-            plt.xlabel('RSSI (dBm)')
-            plt.ylabel('Latency (μs)')
-            plt.title('RSSI vs Latency')
-            plt.grid(True, alpha=0.3)
+        if 'rssi' in columns and 'lat_us' in columns:
+            # Hexbin density instead of one marker per sample
+            valid = ~(np.isnan(columns['rssi']) | np.isnan(columns['lat_us']))
+            ax[1, 1].hexbin(columns['rssi'][valid], columns['lat_us'][valid], gridsize=50, mincnt=1)
+            ax[1, 1].set_xlabel('RSSI (dBm)')
+            ax[1, 1].set_ylabel('Latency (μs)')
+            ax[1, 1].set_title('RSSI vs Latency')
+            ax[1, 1].grid(True, alpha=0.3)
         
-        plt.tight_layout()
+        fig.tight_layout()
         
         # Save plot
         output_file = Path(output_dir) / "esp_now_analysis.png"
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+        fig.savefig(output_file, dpi=300, bbox_inches='tight')
         print(f"📊 Visualizations saved to {output_file}")
         
         plt.show()
+        plt.close(fig)
 
 
 def main():
@@ -189,7 +471,7 @@ def main():
     parser = argparse.ArgumentParser(description="ESP-NOW Data Analyzer")
     
     parser.add_argument('input_file', nargs='?',
-                       help='Input CSV file path')
+                       help='Input Parquet or CSV file path, or a directory of them')
     parser.add_argument('--output', '-o', default="reports/",
                        help='Output directory for reports (default: reports/)')
     parser.add_argument('--no-plots', action='store_true',
@@ -201,12 +483,12 @@ def main():
         # Look for latest file in data/raw/
         data_dir = Path("data/raw")
         if data_dir.exists():
-            csv_files = list(data_dir.glob("*.csv"))
-            if csv_files:
-                args.input_file = str(sorted(csv_files)[-1])  # Most recent
+            data_files = find_data_files(data_dir)
+            if data_files:
+                args.input_file = str(max(data_files, key=lambda p: p.stat().st_mtime))  # Most recent
                 print(f"🔍 Using latest data file: {args.input_file}")
             else:
-                print("❌ No CSV files found in data/raw/")
+                print("❌ No Parquet or CSV files found in data/raw/")
                 sys.exit(1)
         else:
             print("❌ No input file specified and data/raw/ not found")
@@ -217,9 +499,46 @@ def main():
     analyzer = ESP8266DataAnalyzer(args.input_file)
     
     try:
+        if Path(args.input_file).is_dir():
+            from joblib import Parallel, delayed  # only directory runs need it
+            
+            # Sessions are independent (seq restarts per file), so summarize
+            # each file separately; Polars releases the GIL, so threads suffice
+            files = find_data_files(args.input_file)
+            if not files:
+                print(f"❌ No Parquet or CSV files found in {args.input_file}")
+                sys.exit(1)
+            all_stats = Parallel(n_jobs=-1, prefer="threads")(
+                delayed(_try_file_stats)(str(f)) for f in files
+            )
+            # One bad session shouldn't sink the report for the others
+            summarized = 0
+            for data_file, stats in zip(files, all_stats):
+                print(f"\n📁 {data_file.name}")
+                try:
+                    if isinstance(stats, Exception):
+                        raise stats
+                    analyzer.print_summary(stats)
+                    summarized += 1
+                except Exception as e:
+                    print(f"❌ Failed to analyze {data_file.name}: {e}")
+            if not summarized:
+                sys.exit(1)
+            
+            # Plots combine every session in the directory
+            if not args.no_plots:
+                if not analyzer.load_data():
+                    sys.exit(1)
+                analyzer.create_visualizations(args.output)
+            return
+        
         if not analyzer.load_data():
             sys.exit(1)
         
+        # Plots need every row anyway, so read the file once for both
+        if not args.no_plots:
+            analyzer.materialize()
+        
         # Print summary
         analyzer.print_summary()
         
@@ -3,35 +3,116 @@
 ESP-NOW Data Collector for Web of Grace Project
 
 Collects JSON metrics from ESP8266 ESP-NOW ping-pong nodes via serial.
-Parses data into pandas DataFrame and exports to CSV.
+Buffers samples in typed columnar arrays and exports to Parquet (or CSV).
 
 Usage:
-    python collect.py --port COM3 --output data/raw/session_001.csv
+    python collect.py --port COM3 --output data/raw/session_001.parquet
+    python collect.py --port COM3 --output data/raw/session_001.csv  # legacy CSV
     python collect.py --port /dev/ttyUSB0 --duration 300  # 5 minutes
 """
 
 import argparse
-import json
+import logging
 import time
 import sys
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Optional
 
+import numpy as np
+import orjson
+import polars as pl
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import serial
-import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds between progress lines during collection
+PROGRESS_INTERVAL = 5.0
+
+# On-disk layout of collected samples
+SAMPLE_SCHEMA = pa.schema([
+    ('seq', pa.uint32()),
+    ('rssi', pa.int16()),
+    ('lat_us', pa.uint32()),
+    ('timestamp_ns', pa.int64()),
+    ('error', pa.string()),
+])
+
+
+class RunningStats:
+    """Online count/min/max/mean/variance using Welford's algorithm."""
+    
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+    
+    def update(self, x: float):
+        """Fold one observation into the running moments."""
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        if self.min is None or x < self.min:
+            self.min = x
+        if self.max is None or x > self.max:
+            self.max = x
+    
+    @property
+    def std(self) -> float:
+        """Sample standard deviation (0.0 until there are two observations)."""
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else 0.0
 
 
 class ESP8266DataCollector:
     """Collects and processes ESP-NOW metrics from serial port."""
     
-    def __init__(self, port: str, baudrate: int = 115200, timeout: float = 1.0):
-        """Initialize collector with serial port configuration."""
+    def __init__(self, port: str, baudrate: int = 115200, timeout: float = 1.0,
+                 capacity: int = 4096, output: Optional[str] = None,
+                 row_group_size: int = 100_000):
+        """Initialize collector with serial port configuration.
+        
+        If ``output`` is a Parquet path, samples are streamed to it in row
+        groups of ``row_group_size`` while collecting, keeping memory bounded.
+        """
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
         self.serial_conn: Optional[serial.Serial] = None
-        self.data_buffer: List[Dict] = []
+        self._read_buf = bytearray()  # Partial line carried between reads
+        
+        # Samples are stored column-wise in typed arrays, grown by doubling.
+        # Dtypes match the firmware: uint32 seq/latency, RSSI fits in int16.
+        self._n = 0
+        self._seq = np.empty(capacity, np.uint32)
+        self._rssi = np.empty(capacity, np.int16)
+        self._lat = np.empty(capacity, np.uint32)
+        self._ts_ns = np.empty(capacity, np.int64)
+        # Timeout rows are kept too: _err indexes _error_kinds (-1 for a normal
+        # sample) and their seq/rssi/lat_us are written as nulls
+        self._err = np.empty(capacity, np.int8)
+        self._error_kinds: list = []
+        self.error_count = 0
+        
+        # Summary stats kept up to date per sample, so no end-of-run rescan
+        self.rssi_stats = RunningStats()
+        self.latency_stats = RunningStats()
+        
+        # Non-JSON lines (boot messages, debug traces) are counted, and logged at most once a second
+        self.skipped_lines = 0
+        self._last_skip_log = 0.0
+        
+        # Incremental Parquet output, opened on connect
+        self.output = output
+        self.row_group_size = row_group_size
+        self.rows_written = 0
+        self._writer: Optional[pq.ParquetWriter] = None
         
     def connect(self) -> bool:
         """Establish serial connection to ESP8266."""
@@ -42,33 +123,141 @@ class ESP8266DataCollector:
                 timeout=self.timeout
             )
             print(f"✅ Connected to {self.port} at {self.baudrate} baud")
-            return True
         except serial.SerialException as e:
             print(f"❌ Failed to connect to {self.port}: {e}")
             return False
+        
+        if self.output and Path(self.output).suffix.lower() != '.csv':
+            Path(self.output).parent.mkdir(parents=True, exist_ok=True)
+            self._writer = pq.ParquetWriter(self.output, SAMPLE_SCHEMA, compression='snappy')
+            print(f"💾 Streaming samples to {self.output}")
+        return True
     
     def disconnect(self):
-        """Close serial connection."""
+        """Close serial connection and finish any streamed output."""
+        if self._writer is not None:
+            self._close_writer()
         if self.serial_conn and self.serial_conn.is_open:
             self.serial_conn.close()
             print("🔌 Serial connection closed")
     
-    def parse_json_line(self, line: str) -> Optional[Dict]:
-        """Parse JSON line from ESP8266 output."""
+    def _to_arrow(self) -> pa.Table:
+        """Wrap the buffered sample arrays in an Arrow table."""
+        n = self._n
+        err = self._err[:n]
+        ok = err < 0
+        metrics = [pa.array(col[:n], mask=~ok) for col in (self._seq, self._rssi, self._lat)]
+        error = pc.take(pa.array(self._error_kinds, pa.string()), pa.array(err, mask=ok))
+        return pa.Table.from_arrays(
+            metrics + [pa.array(self._ts_ns[:n]), error],
+            schema=SAMPLE_SCHEMA
+        )
+    
+    def _flush(self):
+        """Write the buffered samples as one row group and empty the buffer."""
+        if self._n == 0:
+            return
+        self._writer.write_table(self._to_arrow())
+        self.rows_written += self._n
+        self._n = 0
+    
+    def _close_writer(self) -> bool:
+        """Flush remaining samples and finalize the streamed Parquet file."""
+        self._flush()
+        self._writer.close()
+        self._writer = None
+        
+        if self.rows_written == 0:
+            Path(self.output).unlink(missing_ok=True)
+            print("⚠️  No data to save")
+            return False
+        
+        print(f"💾 Data saved to {self.output} ({self.rows_written} rows)")
+        return True
+    
+    def _grow(self):
+        """Double the capacity of the sample arrays."""
+        capacity = 2 * len(self._seq)
+        for name in ('_seq', '_rssi', '_lat', '_ts_ns', '_err'):
+            old = getattr(self, name)
+            new = np.empty(capacity, old.dtype)
+            new[:self._n] = old[:self._n]
+            setattr(self, name, new)
+    
+    def _append_row(self, i: int):
+        """Stamp buffer row i with the host receive time and commit it."""
+        # Host receive time as int64 epoch nanoseconds
+        self._ts_ns[i] = time.time_ns()
+        self._n += 1
+        if self._writer is not None and self._n >= self.row_group_size:
+            self._flush()
+    
+    def _skip_line(self, line: bytes, reason: str):
+        """Count an unparseable line, logging it with a rate limit."""
+        self.skipped_lines += 1
+        now = time.monotonic()
+        if now - self._last_skip_log >= 1.0:
+            self._last_skip_log = now
+            logger.debug("Skipped %d non-JSON lines so far (%s): %r",
+                         self.skipped_lines, reason, bytes(line))
+    
+    def parse_json_line(self, line: bytes) -> bool:
+        """Parse raw JSON line bytes from ESP8266 output into the sample buffer.
+        
+        Timeout lines (``{"error": ...}``) are recorded as rows with null
+        metrics but do not count as samples.
+        
+        Returns:
+            True if the line was a metrics sample and has been recorded
+        """
         line = line.strip()
         if not line:
-            return None
+            return False
+        
+        # Cheap reject for anything that can't be a JSON object (0x7B '{', 0x7D '}')
+        if line[0] != 0x7B or line[-1] != 0x7D:
+            self._skip_line(line, "not a JSON object")
+            return False
             
         try:
-            data = json.loads(line)
-            # Add timestamp
-            data['timestamp'] = datetime.now().isoformat()
-            return data
-        except json.JSONDecodeError as e:
-            print(f"⚠️  JSON parse error: {e} | Line: {line}")
-            return None
-    
-    def collect_data(self, duration: Optional[float] = None, max_samples: Optional[int] = None) -> List[Dict]:
+            # The firmware emits ASCII JSON, so orjson can parse the bytes as-is
+            data = orjson.loads(line)
+        except orjson.JSONDecodeError as e:
+            self._skip_line(line, f"JSON parse error: {e}")
+            return False
+        
+        if not isinstance(data, dict):
+            return False
+        
+        if self._n == len(self._seq):
+            self._grow()
+        i = self._n
+        
+        if 'error' in data:
+            kind = str(data['error'])
+            if kind not in self._error_kinds:
+                self._error_kinds.append(kind)
+            self._err[i] = self._error_kinds.index(kind)
+            self._seq[i] = self._rssi[i] = self._lat[i] = 0
+            self._append_row(i)
+            self.error_count += 1
+            return False
+        
+        try:
+            self._seq[i] = data['seq']
+            self._rssi[i] = data['rssi']
+            self._lat[i] = data['lat_us']
+        except (KeyError, TypeError, ValueError, OverflowError):
+            return False
+        self._err[i] = -1
+        self._append_row(i)
+        
+        # Summarize the stored (typed) values, not the raw JSON ones
+        self.rssi_stats.update(int(self._rssi[i]))
+        self.latency_stats.update(int(self._lat[i]))
+        return True
+    
+    def collect_data(self, duration: Optional[float] = None, max_samples: Optional[int] = None) -> int:
         """
         Collect data from serial port.
         
@@ -77,12 +266,13 @@ class ESP8266DataCollector:
             max_samples: Maximum number of samples to collect
             
         Returns:
-            List of parsed JSON records
+            Number of samples collected
         """
         if not self.serial_conn or not self.serial_conn.is_open:
             raise RuntimeError("Serial connection not established")
         
-        start_time = time.time()
+        start_time = time.monotonic()
+        last_progress = start_time
         sample_count = 0
         
         print(f"📡 Starting data collection...")
@@ -94,69 +284,100 @@ class ESP8266DataCollector:
         try:
             while True:
                 # Check termination conditions
-                if duration and (time.time() - start_time) >= duration:
+                if duration and (time.monotonic() - start_time) >= duration:
                     print(f"⏰ Duration limit reached ({duration}s)")
                     break
                 if max_samples and sample_count >= max_samples:
                     print(f"📊 Sample limit reached ({max_samples})")
                     break
                 
-                # Read line from serial
-                try:
-                    line = self.serial_conn.readline().decode('utf-8', errors='ignore')
-                    if line:
-                        parsed = self.parse_json_line(line)
-                        if parsed:
-                            self.data_buffer.append(parsed)
-                            sample_count += 1
-                            
-                            # Print progress every 10 samples
-                            if sample_count % 10 == 0:
-                                elapsed = time.time() - start_time
-                                print(f"📈 Samples: {sample_count}, Elapsed: {elapsed:.1f}s")
-                                
-                except UnicodeDecodeError:
-                    continue  # Skip malformed data
+                # Bulk-read whatever is waiting, then split out complete lines
+                chunk = self.serial_conn.read(max(1, self.serial_conn.in_waiting))
+                if not chunk:
+                    continue
+                self._read_buf.extend(chunk)
+                *lines, tail = self._read_buf.split(b'\n')
+                self._read_buf = bytearray(tail)
+                
+                for line in lines:
+                    if self.parse_json_line(line):
+                        sample_count += 1
+                        if max_samples and sample_count >= max_samples:
+                            break
+                
+                # Progress is checked once per read chunk, not per sample
+                now = time.monotonic()
+                if now - last_progress >= PROGRESS_INTERVAL:
+                    last_progress = now
+                    print(f"📈 Samples: {sample_count}, Elapsed: {now - start_time:.1f}s")
                     
         except KeyboardInterrupt:
             print(f"\n⏹️  Collection stopped by user")
         
-        elapsed = time.time() - start_time
-        print(f"✅ Collection complete: {len(self.data_buffer)} samples in {elapsed:.1f}s")
+        elapsed = time.monotonic() - start_time
+        print(f"✅ Collection complete: {sample_count} samples in {elapsed:.1f}s")
+        if self.skipped_lines:
+            print(f"⚠️  Skipped {self.skipped_lines} non-JSON lines (use --verbose to see them)")
         
-        return self.data_buffer.copy()
+        return sample_count
     
-    def to_dataframe(self) -> pd.DataFrame:
-        """Convert collected data to pandas DataFrame."""
-        if not self.data_buffer:
-            return pd.DataFrame()
-        
-        df = pd.DataFrame(self.data_buffer)
+    def to_dataframe(self) -> pl.DataFrame:
+        """Wrap the buffered samples in a Polars DataFrame.
         
-        # Ensure timestamp is datetime
-        if 'timestamp' in df.columns:
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-        
-        return df
+        Raises:
+            RuntimeError: if samples have been streamed to ``output``, since
+                the buffer then holds only the rows not yet written there
+        """
+        if self._writer is not None or self.rows_written:
+            raise RuntimeError(f"samples are streamed to {self.output}; "
+                               f"save there or read that file instead")
+        return pl.from_arrow(self._to_arrow())
     
     def save_to_csv(self, filepath: str) -> bool:
         """Save collected data to CSV file."""
         try:
             df = self.to_dataframe()
-            if df.empty:
+            if df.is_empty():
                 print("⚠️  No data to save")
                 return False
             
             # Ensure output directory exists
             Path(filepath).parent.mkdir(parents=True, exist_ok=True)
             
-            df.to_csv(filepath, index=False)
+            df.write_csv(filepath)
             print(f"💾 Data saved to {filepath} ({len(df)} rows)")
             return True
             
         except Exception as e:
             print(f"❌ Failed to save CSV: {e}")
             return False
+    
+    def save_to_parquet(self, filepath: str) -> bool:
+        """Save collected data to a Snappy-compressed Parquet file."""
+        try:
+            df = self.to_dataframe()
+            if df.is_empty():
+                print("⚠️  No data to save")
+                return False
+            
+            # Ensure output directory exists
+            Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+            
+            df.write_parquet(filepath, compression='snappy')
+            print(f"💾 Data saved to {filepath} ({len(df)} rows)")
+            return True
+            
+        except Exception as e:
+            print(f"❌ Failed to save Parquet: {e}")
+            return False
+    
+    def save(self, filepath: str) -> bool:
+        """Save collected data, picking the format from the file suffix."""
+        if self._writer is not None and Path(filepath) == Path(self.output):
+            return self._close_writer()
+        if Path(filepath).suffix.lower() == '.csv':
+            return self.save_to_csv(filepath)
+        return self.save_to_parquet(filepath)
 
 
 def main():
@@ -172,36 +393,41 @@ def main():
     parser.add_argument('--samples', '-s', type=int,
                        help='Maximum number of samples to collect')
     parser.add_argument('--output', '-o',
-                       help='Output CSV file path')
+                       help='Output file path (.parquet, or .csv for legacy CSV)')
+    parser.add_argument('--verbose', '-v', action='store_true',
+                       help='Log skipped non-JSON lines (rate limited)')
     
     args = parser.parse_args()
     
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.WARNING,
+                        format='%(levelname)s %(message)s')
+    
     # Generate default output filename if not provided
     if not args.output:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        args.output = f"data/raw/esp_now_data_{timestamp}.csv"
+        args.output = f"data/raw/esp_now_data_{timestamp}.parquet"
     
     # Initialize collector
-    collector = ESP8266DataCollector(args.port, args.baudrate)
+    collector = ESP8266DataCollector(args.port, args.baudrate, output=args.output)
     
     try:
         # Connect and collect data
         if not collector.connect():
             sys.exit(1)
         
-        data = collector.collect_data(duration=args.duration, max_samples=args.samples)
+        sample_count = collector.collect_data(duration=args.duration, max_samples=args.samples)
         
-        if data:
-            collector.save_to_csv(args.output)
+        if sample_count or collector.error_count:
+            collector.save(args.output)
             
-            # Print summary statistics
-            df = collector.to_dataframe()
+            # Print summary statistics from the running totals
+            rssi = collector.rssi_stats
+            lat = collector.latency_stats
             print(f"\n📊 Data Summary:")
-            print(f"   Total samples: {len(df)}")
-            if 'rssi' in df.columns:
-                print(f"   RSSI range: {df['rssi'].min()} to {df['rssi'].max()} dBm")
-            if 'lat_us' in df.columns:
-                print(f"   Latency range: {df['lat_us'].min()} to {df['lat_us'].max()} μs")
+            print(f"   Total samples: {rssi.count}")
+            print(f"   Timeouts: {collector.error_count}")
+            print(f"   RSSI range: {rssi.min} to {rssi.max} dBm (mean {rssi.mean:.1f} ±{rssi.std:.1f})")
+            print(f"   Latency range: {lat.min} to {lat.max} μs (mean {lat.mean:.0f} ±{lat.std:.0f})")
         else:
             print("⚠️  No valid data collected")
             
@@ -25,17 +25,24 @@ def test_esp8266_output(port, duration=30):
         start_time = time.time()
         line_count = 0
         json_count = 0
+        buf = bytearray()  # Partial line carried between reads
         
         while (time.time() - start_time) < duration:
             try:
-                line = ser.readline().decode('utf-8', errors='ignore').strip()
-                if line:
-                    line_count += 1
-                    print(f"[{time.time() - start_time:.1f}s] {line}")
-                    
-                    # Check if it looks like JSON
-                    if line.startswith('{') and line.endswith('}'):
-                        json_count += 1
+                # Bulk-read whatever is waiting, like collect.py, then split lines
+                buf.extend(ser.read(max(1, ser.in_waiting)))
+                *lines, tail = buf.split(b'\n')
+                buf = bytearray(tail)
+                
+                for raw_line in lines:
+                    line = raw_line.decode('utf-8', errors='ignore').strip()
+                    if line:
+                        line_count += 1
+                        print(f"[{time.time() - start_time:.1f}s] {line}")
+                        
+                        # Check if it looks like JSON
+                        if line.startswith('{') and line.endswith('}'):
+                            json_count += 1
                         
             except KeyboardInterrupt:
                 break